@@ -1,10 +1,29 @@
+from ctypes import addressof, c_char, c_ulonglong, c_void_p, create_string_buffer
 from warnings import warn as warnings_warn
 
 try:
-    from libnacl import crypto_aead_xchacha20poly1305_ietf_encrypt, crypto_aead_xchacha20poly1305_ietf_decrypt, crypto_aead_aes256gcm_encrypt, crypto_aead_aes256gcm_decrypt
+    from libnacl import nacl, crypto_aead_xchacha20poly1305_ietf_KEYBYTES, crypto_aead_xchacha20poly1305_ietf_ABYTES, crypto_aead_aes256gcm_KEYBYTES, crypto_aead_aes256gcm_ABYTES, HAS_AEAD_AES256GCM
+    crypto_aead_aes256gcm_STATEBYTES = nacl.crypto_aead_aes256gcm_statebytes()
 except ImportError:
+    HAS_AEAD_AES256GCM = False
     warnings_warn('libnacl is not installed, AES support is disabled')
 
+try:
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:
+    AESGCM = None
+
+
+def _buffer(data):
+    # ctypes only converts bytes on its own, writable buffers (a bytearray or a view of one) are handed over without a copy
+    if isinstance(data, bytes):
+        return data
+
+    try:
+        return (c_char * len(data)).from_buffer(data)
+    except TypeError:
+        return bytes(data)
+
 
 class AEScrypt:
     """
@@ -15,19 +34,58 @@ class AEScrypt:
     def __init__(self, key: bytes, ciper: str):
         self._key = key
         self.cipher = ciper
+
+        # Call libsodium through libnacl's handle directly; the key is checked once here and callers always
+        # pass correctly sized nonces, so libnacl's per-call argument checks are skipped on every packet
+        if ciper == 'aead_xchacha20_poly1305_rtpsize':
+            key_size = crypto_aead_xchacha20poly1305_ietf_KEYBYTES
+            self._abytes = crypto_aead_xchacha20poly1305_ietf_ABYTES
+            self._encrypt = nacl.crypto_aead_xchacha20poly1305_ietf_encrypt
+            self._decrypt = nacl.crypto_aead_xchacha20poly1305_ietf_decrypt
+            self._secret = key
+        elif HAS_AEAD_AES256GCM:
+            key_size = crypto_aead_aes256gcm_KEYBYTES
+            self._abytes = crypto_aead_aes256gcm_ABYTES
+            self._encrypt = nacl.crypto_aead_aes256gcm_encrypt_afternm
+            self._decrypt = nacl.crypto_aead_aes256gcm_decrypt_afternm
+
+            # Expand the key schedule once, every packet then reuses it; libsodium needs the state 16 byte aligned
+            self._state_buf = create_string_buffer(crypto_aead_aes256gcm_STATEBYTES + 15)
+            self._secret = c_void_p(addressof(self._state_buf) + (-addressof(self._state_buf) % 16))
+        elif AESGCM:
+            # libsodium only implements AES-GCM on CPUs with hardware AES, fall back to OpenSSL's implementation
+            self._aesgcm = AESGCM(key)
+            self.encrypt = self._aesgcm_encrypt
+            self.decrypt = self._aesgcm_decrypt
+            return
+        else:
+            raise ValueError('AES256-GCM is not supported on this CPU by libsodium, and cryptography is not installed')
+
+        if len(key) != key_size:
+            raise ValueError('Invalid key')
+
+        if ciper != 'aead_xchacha20_poly1305_rtpsize' and nacl.crypto_aead_aes256gcm_beforenm(self._secret, key):
+            raise ValueError('Failed to expand AES256-GCM key')
         return
 
     def __bytes__(self) -> bytes:
         return self._key
 
+    # The output length is always input +/- ABYTES, so libsodium is passed NULL rather than a length to write back
     def encrypt(self, plaintext: bytes, nonce: bytes, aad: bytes) -> bytes:
-        if self.cipher == 'aead_xchacha20_poly1305_rtpsize':
-            return crypto_aead_xchacha20poly1305_ietf_encrypt(message=plaintext, aad=aad, nonce=nonce, key=self._key)
-        else:
-            return crypto_aead_aes256gcm_encrypt(message=plaintext, aad=aad, nonce=nonce, key=self._key)
+        c = create_string_buffer(len(plaintext) + self._abytes)
+        if self._encrypt(c, None, _buffer(plaintext), c_ulonglong(len(plaintext)), _buffer(aad), c_ulonglong(len(aad)), None, _buffer(nonce), self._secret):
+            raise ValueError('Failed to encrypt message')
+        return c.raw
 
     def decrypt(self, ciphertext: bytes, nonce: bytes, aad: bytes) -> bytes:
-        if self.cipher == 'aead_xchacha20_poly1305_rtpsize':
-            return crypto_aead_xchacha20poly1305_ietf_decrypt(ctxt=ciphertext, aad=aad, nonce=nonce, key=self._key)
-        else:
-            return crypto_aead_aes256gcm_decrypt(ctxt=ciphertext, aad=aad, nonce=nonce, key=self._key)
+        m = create_string_buffer(len(ciphertext) - self._abytes)
+        if self._decrypt(m, None, None, _buffer(ciphertext), c_ulonglong(len(ciphertext)), _buffer(aad), c_ulonglong(len(aad)), _buffer(nonce), self._secret):
+            raise ValueError('Failed to decrypt message')
+        return m.raw
+
+    def _aesgcm_encrypt(self, plaintext: bytes, nonce: bytes, aad: bytes) -> bytes:
+        return self._aesgcm.encrypt(nonce, plaintext, aad)
+
+    def _aesgcm_decrypt(self, ciphertext: bytes, nonce: bytes, aad: bytes) -> bytes:
+        return self._aesgcm.decrypt(nonce, ciphertext, aad)
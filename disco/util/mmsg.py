@@ -0,0 +1,183 @@
+from ctypes import CDLL, Structure, POINTER, addressof, c_char, c_int, c_size_t, c_uint, c_void_p, get_errno, pointer
+from errno import EAGAIN, EINTR, EWOULDBLOCK
+from os import strerror as os_strerror
+from platform import system as platform_system
+import socket
+
+from gevent import spawn as gevent_spawn
+from gevent.event import Event as GeventEvent
+from gevent.socket import wait_read as gevent_wait_read, wait_write as gevent_wait_write
+
+from disco.util.logging import LoggingClass
+
+
+class iovec(Structure):
+    _fields_ = [
+        ('iov_base', c_void_p),
+        ('iov_len', c_size_t),
+    ]
+
+
+class msghdr(Structure):
+    _fields_ = [
+        ('msg_name', c_void_p),
+        ('msg_namelen', c_uint),  # socklen_t
+        ('msg_iov', POINTER(iovec)),
+        ('msg_iovlen', c_size_t),
+        ('msg_control', c_void_p),
+        ('msg_controllen', c_size_t),
+        ('msg_flags', c_int),
+    ]
+
+
+class mmsghdr(Structure):
+    _fields_ = [
+        ('msg_hdr', msghdr),
+        ('msg_len', c_uint),
+    ]
+
+
+_recvmmsg = None
+_sendmmsg = None
+MSG_DONTWAIT = 0
+
+# recvmmsg(2)/sendmmsg(2) are Linux-only; everything else falls back to plain recv_into()/send() on the connected socket
+if platform_system() == 'Linux':
+    MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0)
+
+    try:
+        _libc = CDLL(None, use_errno=True)
+    except OSError:
+        _libc = None
+
+    if _libc:
+        try:
+            _recvmmsg = _libc.recvmmsg
+            _recvmmsg.argtypes = [c_int, POINTER(mmsghdr), c_uint, c_int, c_void_p]
+            _recvmmsg.restype = c_int
+        except AttributeError:
+            _recvmmsg = None
+
+        try:
+            _sendmmsg = _libc.sendmmsg
+            _sendmmsg.argtypes = [c_int, POINTER(mmsghdr), c_uint, c_int]
+            _sendmmsg.restype = c_int
+        except AttributeError:
+            _sendmmsg = None
+
+HAS_RECVMMSG = _recvmmsg is not None
+HAS_SENDMMSG = _sendmmsg is not None
+
+
+class RecvMMsg:
+    """
+    Reaps up to `vlen` datagrams from a UDP socket with a single recvmmsg(2) call.
+
+    Each slot is backed by a persistent bytearray, the memoryviews returned from
+    :meth:`recv` point into those buffers and are only valid until the next call.
+    """
+    def __init__(self, sock, vlen=16, size=1500):
+        self.vlen = vlen
+        self.size = size
+        self._fd = sock.fileno()
+
+        self.buffers = [bytearray(size) for _ in range(vlen)]
+        self.views = [memoryview(buf) for buf in self.buffers]
+
+        self._iovs = (iovec * vlen)()
+        self._msgs = (mmsghdr * vlen)()
+        self._c_buffers = [(c_char * size).from_buffer(buf) for buf in self.buffers]
+
+        for i, c_buf in enumerate(self._c_buffers):
+            self._iovs[i].iov_base = addressof(c_buf)
+            self._iovs[i].iov_len = size
+            self._msgs[i].msg_hdr.msg_iov = pointer(self._iovs[i])
+            self._msgs[i].msg_hdr.msg_iovlen = 1
+
+    def recv(self):
+        while True:
+            count = _recvmmsg(self._fd, self._msgs, self.vlen, MSG_DONTWAIT, None)
+            if count >= 0:
+                return [self.views[i][:self._msgs[i].msg_len] for i in range(count)]
+
+            err = get_errno()
+            if err in (EAGAIN, EWOULDBLOCK):
+                # Nothing queued, yield to the hub until the socket is readable
+                gevent_wait_read(self._fd)
+            elif err != EINTR:
+                raise OSError(err, os_strerror(err))
+
+
+class UDPVoiceSender(LoggingClass):
+    """
+    A process-wide outbound queue shared by every voice connection.
+
+    Datagrams queued during a single pass of the gevent hub are drained by one
+    background greenlet, which issues a single sendmmsg(2) per socket rather
+    than a sendto() per datagram.
+    """
+    _instance = None
+
+    def __init__(self, vlen=64):
+        super(UDPVoiceSender, self).__init__()
+        self.vlen = vlen
+
+        self._queue = {}
+        self._event = GeventEvent()
+        self._task = gevent_spawn(self._run)
+
+    @classmethod
+    def get(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def send(self, sock, data):
+        # Keyed by the socket itself, a raw fd could be closed and reused by another socket before the next flush
+        self._queue.setdefault(sock, []).append(bytes(data))
+        self._event.set()
+
+    def _run(self):
+        while True:
+            self._event.wait()
+            self._event.clear()
+
+            queue, self._queue = self._queue, {}
+            for sock, frames in queue.items():
+                fd = sock.fileno()
+                if fd == -1:
+                    self.log.debug('Dropping {} datagram(s) queued on a closed socket'.format(len(frames)))
+                    continue
+
+                for i in range(0, len(frames), self.vlen):
+                    try:
+                        self._flush(fd, frames[i:i + self.vlen])
+                    except OSError as e:
+                        self.log.debug('Failed to send {} datagram(s) on fd {}: {}'.format(len(frames[i:i + self.vlen]), fd, e))
+
+    def _flush(self, fd, frames):
+        count = len(frames)
+        msgs = (mmsghdr * count)()
+        iovs = (iovec * count)()
+        refs = []
+
+        for i, data in enumerate(frames):
+            c_data = (c_char * len(data)).from_buffer_copy(data)
+            refs.append(c_data)
+            iovs[i].iov_base = addressof(c_data)
+            iovs[i].iov_len = len(data)
+            msgs[i].msg_hdr.msg_iov = pointer(iovs[i])
+            msgs[i].msg_hdr.msg_iovlen = 1
+
+        sent = 0
+        while sent < count:
+            ret = _sendmmsg(fd, pointer(msgs[sent]), count - sent, MSG_DONTWAIT)
+            if ret >= 0:
+                sent += ret
+                continue
+
+            err = get_errno()
+            if err in (EAGAIN, EWOULDBLOCK):
+                gevent_wait_write(fd)
+            elif err != EINTR:
+                raise OSError(err, os_strerror(err))
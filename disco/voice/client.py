@@ -7,6 +7,7 @@ from websocket import WebSocketConnectionClosedException, WebSocketTimeoutExcept
 from disco.gateway.encoding import ENCODERS
 from disco.gateway.packets import OPCode
 from disco.types.base import cached_property
+from disco.util.crypto import AESGCM, HAS_AEAD_AES256GCM
 from disco.util.emitter import Emitter
 from disco.util.logging import LoggingClass
 from disco.util.websocket import Websocket
@@ -332,6 +333,11 @@ class VoiceClient(LoggingClass):
 
         for mode in self.enc_modes:
             if mode in self.SUPPORTED_MODES:
+                # libsodium only has AES-GCM with hardware AES, without cryptography to fall back on prefer another mode
+                if mode == 'aead_aes256_gcm_rtpsize' and not (HAS_AEAD_AES256GCM or AESGCM):
+                    self.log.debug('[{}] Skipping mode {}, AES256-GCM is unavailable on this system'.format(self.channel_id, mode))
+                    continue
+
                 self.mode = mode
                 self.log.debug('[{}] Selected mode {}'.format(self.channel_id, mode))
                 break
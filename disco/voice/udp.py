@@ -1,11 +1,22 @@
-from collections import namedtuple
-from struct import pack_into as struct_pack_into, unpack_from as struct_unpack_from, unpack as struct_unpack
-from socket import socket, gethostbyname as socket_gethostbyname, AF_INET as SOCKET_AF_INET, SOCK_DGRAM as SOCKET_SOCK_DGRAM
-from gevent import spawn as gevent_spawn, Timeout as GeventTimeout
+from re import compile as re_compile
+from struct import Struct, pack_into as struct_pack_into, unpack as struct_unpack
+from socket import socket, gethostbyname as socket_gethostbyname, AF_INET as SOCKET_AF_INET, SOCK_DGRAM as SOCKET_SOCK_DGRAM, \
+    SOL_SOCKET as SOCKET_SOL_SOCKET, SO_SNDBUF as SOCKET_SO_SNDBUF, SO_RCVBUF as SOCKET_SO_RCVBUF, IPPROTO_IP as SOCKET_IPPROTO_IP, IP_TOS as SOCKET_IP_TOS, timeout as SocketTimeout
+from gevent import spawn as gevent_spawn
 
 from disco.util.crypto import AEScrypt
 from disco.util.enum import Enum
 from disco.util.logging import LoggingClass
+from disco.util.mmsg import HAS_RECVMMSG, HAS_SENDMMSG, RecvMMsg, UDPVoiceSender
+
+# Scatter-gather sends aren't available everywhere (notably Windows)
+HAS_SENDMSG = hasattr(socket, 'sendmsg')
+
+# Supported encryption modes and their nonce size, both use a 4 byte incrementing nonce appended to the payload
+EncryptionModes = {
+    'aead_aes256_gcm_rtpsize': 12,  # 96-bits
+    'aead_xchacha20_poly1305_rtpsize': 24,  # 192-bits
+}
 
 AudioCodecs = ('opus',)
 VideoCodecs = ('AV1X', 'H265', 'H264', 'VP8', 'VP9')
@@ -29,71 +40,131 @@ RTCPPayloadTypes = Enum(
     PSFB=206,
 )
 
-MAX_UINT32 = 4294967295
-MAX_SEQUENCE = 65535
+# Payload type number to enum attribute, so the receive loop does a single dict lookup per packet
+RTP_PAYLOAD_TYPES = {attr.value: attr for attr in RTPPayloadTypes.attrs}
+RTCP_PAYLOAD_TYPES = {attr.value: attr for attr in RTCPPayloadTypes.attrs}
+OPUS_PAYLOAD_TYPE = RTPPayloadTypes.OPUS.value
+
+# Both double as masks for wrapping the RTP counters
+MAX_UINT32 = 0xFFFFFFFF  # 4294967295
+MAX_SEQUENCE = 0xFFFF  # 65535
 
 RTP_HEADER_VERSION = 0x80  # Only RTP Version is set here (value of 2 << 6)
+
+# Precompiled so each header is packed/unpacked with a single call
+RTP_HEADER_PACK = Struct('>HI')  # BE, sequence (unsigned short), timestamp (unsigned int); from byte 2
+RTP_HEADER_UNPACK = Struct('>III')  # BE, 3x unsigned int; the bitfields and sequence are masked out of the first word
+RTCP_HEADER_UNPACK = Struct('>BBHI')  # BE, 2x unsigned char, unsigned short, unsigned int
+NONCE_PACK = Struct('>I')  # BE, unsigned int
 RTP_EXTENSION_ONE_BYTE = (0xBE, 0xDE)
+# One-byte extension element header to (identifier, length), precomputed for every possible byte
+RTP_EXTENSION_ONE_BYTE_DECODE = tuple((b & 0xF, ((b >> 4) & 0xF) + 1) for b in range(256))
+# Finds the end of a run of padding between extension elements, scanned in place over the packet
+RTP_EXTENSION_PADDING_END = re_compile(b'[^\x00]').search
+
+
+class _PacketRecord:
+    """
+    Base for the per-packet records below; plain `__slots__` classes construct
+    noticeably faster than namedtuples, while still unpacking and comparing like them.
+    """
+    __slots__ = ()
+    _fields = ()
+
+    def __iter__(self):
+        return (getattr(self, field) for field in self._fields)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and tuple(self) == tuple(other)
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, ', '.join('{}={!r}'.format(field, getattr(self, field)) for field in self._fields))
+
+
+class RTPHeader(_PacketRecord):
+    __slots__ = _fields = ('version', 'padding', 'extension', 'csrc_count', 'marker', 'payload_type', 'sequence', 'timestamp', 'ssrc')
+
+    def __init__(self, version, padding, extension, csrc_count, marker, payload_type, sequence, timestamp, ssrc):
+        self.version = version
+        self.padding = padding
+        self.extension = extension
+        self.csrc_count = csrc_count
+        self.marker = marker
+        self.payload_type = payload_type
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.ssrc = ssrc
+
+
+class RTCPHeader(_PacketRecord):
+    __slots__ = _fields = ('version', 'padding', 'reception_count', 'packet_type', 'length', 'ssrc')
+
+    def __init__(self, version, padding, reception_count, packet_type, length, ssrc):
+        self.version = version
+        self.padding = padding
+        self.reception_count = reception_count
+        self.packet_type = packet_type
+        self.length = length
+        self.ssrc = ssrc
 
-RTPHeader = namedtuple('RTPHeader', [
-    'version',
-    'padding',
-    'extension',
-    'csrc_count',
-    'marker',
-    'payload_type',
-    'sequence',
-    'timestamp',
-    'ssrc',
-])
-
-RTCPHeader = namedtuple('RTCPHeader', [
-    'version',
-    'padding',
-    'reception_count',
-    'packet_type',
-    'length',
-    'ssrc',
-])
-
-RTCPData = namedtuple('RTCPData', [
-    'client',
-    'user_id',
-    'payload_type',
-    'header',
-    'data',
-])
-
-VoiceData = namedtuple('VoiceData', [
-    'client',
-    'user_id',
-    'payload_type',
-    'rtp',
-    'nonce',
-    'data',
-])
-
-VideoData = namedtuple('VideoData', [
-    'client',
-    'user_id',
-    'payload_type',
-    'rtp',
-    'nonce',
-    'data',
-])
+
+class RTCPData(_PacketRecord):
+    __slots__ = _fields = ('client', 'user_id', 'payload_type', 'header', 'data')
+
+    def __init__(self, client, user_id, payload_type, header, data):
+        self.client = client
+        self.user_id = user_id
+        self.payload_type = payload_type
+        self.header = header
+        self.data = data
+
+
+class _MediaData(_PacketRecord):
+    __slots__ = _fields = ('client', 'user_id', 'payload_type', 'rtp', 'nonce', 'data')
+
+    def __init__(self, client, user_id, payload_type, rtp, nonce, data):
+        self.client = client
+        self.user_id = user_id
+        self.payload_type = payload_type
+        self.rtp = rtp
+        self.nonce = nonce
+        self.data = data
+
+
+class VoiceData(_MediaData):
+    __slots__ = ()
+
+
+class VideoData(_MediaData):
+    __slots__ = ()
 
 
 class UDPVoiceClient(LoggingClass):
+    # Hand outbound frames to the process-wide sendmmsg() queue instead of calling sendto() directly
+    BATCHED_SEND = False
+
+    # Most datagrams reaped per recvmmsg() call on Linux, each slot holds one max-size RTP packet
+    RECV_BATCH_SIZE = 16
+
     def __init__(self, vc):
         super(UDPVoiceClient, self).__init__()
         self.vc = vc
 
+        # The voice client's SSRC maps are only ever mutated in place, so their lookups can be bound once
+        self._audio_ssrcs_get = vc.audio_ssrcs.get
+        self._video_ssrcs_get = vc.video_ssrcs.get
+
         # The underlying UDP socket
         self.conn = None
+        self._sender = UDPVoiceSender.get() if self.BATCHED_SEND and HAS_SENDMMSG else None
 
         # Connection information
         self.ip = None
         self.port = None
+        self._dest = None
         self.connected = False
 
         # Voice information
@@ -102,7 +173,20 @@ class UDPVoiceClient(LoggingClass):
 
         self._nonce = 0
         self._run_task = None
+
+        # Encryption, resolved for the negotiated mode once in setup_encryption
         self._secret_box = None
+        self._encrypt = None
+        self._decrypt = None
+        self._nonce_size = None
+        self._send_nonce = None
+        self._send_nonce_padding = None
+        self._recv_nonce = None
+
+        # Receive buffer, reused for every inbound packet
+        self._rx_buf = bytearray(1500)  # Max RTP packet length
+        self._rx_view = memoryview(self._rx_buf)
+        self._rx_batch = None
 
         # RTP Header
         self._rtp_audio_header = bytearray(12)
@@ -126,229 +210,316 @@ class UDPVoiceClient(LoggingClass):
         self._rtp_video_header[1] = ptype.value
         self.log.debug('[{}] Set UDP\'s Video Codec to {}, RTP payload type {}'.format(self.vc.channel_id, ptype.name.upper(), ptype.value))
 
+    def set_ssrc(self, ssrc):
+        struct_pack_into('>I', self._rtp_audio_header, 8, ssrc)  # BE, unsigned int
+
     def increment_timestamp(self, by):
-        self.timestamp += by
-        if self.timestamp > MAX_UINT32:
-            self.timestamp = 0
+        self.timestamp = (self.timestamp + by) & MAX_UINT32
 
     def setup_encryption(self, encryption_key):
-        self._secret_box = AEScrypt(encryption_key, self.vc.mode)
+        mode = self.vc.mode
+        if mode not in EncryptionModes:
+            raise Exception(f'Voice mode `{mode}` is not supported.')
+
+        self._secret_box = AEScrypt(encryption_key, mode)
+        self._encrypt = self._secret_box.encrypt
+        self._decrypt = self._secret_box.decrypt
+
+        # Both nonces are allocated zeroed once per session; every supported mode is a counter mode, so only
+        # bytes [0:4] are ever written afterwards and the tail is guaranteed to stay zero without re-clearing it
+        self._nonce_size = EncryptionModes[mode]
+        self._send_nonce = bytearray(self._nonce_size)
+        self._send_nonce_padding = memoryview(self._send_nonce)[:4]  # sliced once, appended to every frame
+        self._recv_nonce = bytearray(self._nonce_size)
+        assert not any(self._send_nonce) and not any(self._recv_nonce), 'Voice nonces must start zeroed'
 
     def send_frame(self, frame, sequence=None, timestamp=None, incr_timestamp=None):
+        header = self._rtp_audio_header
+
         # Pack the RTC header into our buffer (a list of numbers)
-        struct_pack_into('>H', self._rtp_audio_header, 2, sequence or self.sequence)  # BE, unsigned short
-        struct_pack_into('>I', self._rtp_audio_header, 4, timestamp or self.timestamp)  # BE, unsigned int
-        struct_pack_into('>i', self._rtp_audio_header, 8, self.vc.ssrc_audio)  # BE, int
+        # The SSRC never changes for the life of this client, it was packed once in connect()
+        RTP_HEADER_PACK.pack_into(header, 2, sequence or self.sequence, timestamp or self.timestamp)
 
-        if self.vc.mode == 'aead_aes256_gcm_rtpsize':
-            nonce = bytearray(12)  # 96-bits
-        else:
-            nonce = bytearray(24)  # 192-bits is 24 bytes
+        # Only the first 4 bytes of the nonce are ever written, the rest stay zeroed
+        nonce = self._send_nonce
 
         # Use an incrementing number as a nonce, only first 4 bytes of the nonce is padded on
-        self._nonce += 1
-        if self._nonce > MAX_UINT32:
-            self._nonce = 0
-        struct_pack_into('>I', nonce, 0, self._nonce)  # BE, unsigned int
-        nonce_padding = nonce[:4]
-
-        if self.vc.mode not in ('aead_xchacha20_poly1305_rtpsize', 'aead_aes256_gcm_rtpsize'):
-            raise Exception(f'Voice mode `{self.vc.mode}` is not supported.')
+        self._nonce = (self._nonce + 1) & MAX_UINT32
+        NONCE_PACK.pack_into(nonce, 0, self._nonce)
 
-        # Encrypt the payload with the nonce
-        payload = self._secret_box.encrypt(plaintext=frame, nonce=bytes(nonce), aad=bytes(self._rtp_audio_header))
+        # Encrypt the payload with the nonce, both buffers are handed to libsodium as-is without copying
+        payload = self._encrypt(plaintext=frame, nonce=nonce, aad=header)
 
-        # Pad the payload with the nonce
-        payload += nonce_padding
-
-        # Send the header (sans nonce padding) plus the payload
-        self.send(self._rtp_audio_header + payload)
+        # Send the header, the payload and the nonce padding, gathered by the kernel without joining them first
+        self.send(header, payload, self._send_nonce_padding)
 
         # Increment our sequence counter
-        self.sequence += 1
-        if self.sequence >= MAX_SEQUENCE:
-            self.sequence = 0
+        self.sequence = (self.sequence + 1) & MAX_SEQUENCE
 
         # Increment our timestamp (if applicable)
         if incr_timestamp:
-            self.timestamp += incr_timestamp
-
-    def run(self):
-        while True:
-            data, addr = self.conn.recvfrom(1500)  # Max RTP packet length
-
-            # Data cannot be less than the bare minimum, just ignore
-            if len(data) <= 12:
-                self.log.debug('[{}] [VoiceData] Received voice data under 13 bytes'.format(self.vc.channel_id))
-                continue
+            self.timestamp = (self.timestamp + incr_timestamp) & MAX_UINT32
 
-            first, second = struct_unpack_from('>BB', data)  # big-endian, 2x unsigned chars
+    def _recv_packets(self):
+        # Batch as many queued datagrams as we can per syscall where supported
+        if self._rx_batch:
+            return self._rx_batch.recv()
 
-            payload_type = RTCPPayloadTypes.get(second)
-            if payload_type:
-                length, ssrc = struct_unpack_from('>HI', data, 2)  # BE, unsigned short, unsigned int
+        n = self.conn.recv_into(self._rx_buf)
+        return (self._rx_view[:n],)
 
-                rtcp = RTCPHeader(
-                    version=first >> 6,
-                    padding=(first >> 5) & 1,
-                    reception_count=first & 0x1F,
-                    packet_type=second,
-                    length=length,
-                    ssrc=ssrc,
-                )
-
-                if rtcp.ssrc == self.vc.ssrc_rtcp:
-                    user_id = self.vc.user_id
-                else:
-                    rtcp_ssrc = rtcp.ssrc
-                    if rtcp_ssrc:
-                        rtcp_ssrc -= 3
-                    user_id = self.vc.audio_ssrcs.get(rtcp_ssrc, None)
-
-                payload = RTCPData(
-                    client=self.vc,
-                    user_id=user_id,
-                    payload_type=payload_type.name,
-                    header=rtcp,
-                    data=data[8:],
-                )
-
-                self.vc.client.events.emit('RTCPData', payload)
-            else:
-                sequence, timestamp, ssrc = struct_unpack_from('>HII', data, 2)  # BE, unsigned short, 2x unsigned int
-
-                rtp = RTPHeader(
-                    version=first >> 6,
-                    padding=(first >> 5) & 1,
-                    extension=(first >> 4) & 1,
-                    csrc_count=first & 0x0F,
-                    marker=second >> 7,
-                    payload_type=second & 0x7F,
-                    sequence=sequence,
-                    timestamp=timestamp,
-                    ssrc=ssrc,
-                )
-
-                # Check if rtp version is 2
-                if rtp.version != 2:
-                    self.log.debug('[{}] [VoiceData] Received an invalid RTP packet version, {}'.format(self.vc.channel_id, rtp.version))
-                    continue
+    def run(self):
+        # Bound once, these are used for every packet
+        emit = self.vc.client.events.emit
+        recv_packets = self._recv_packets
+        handle_rtcp = self._handle_rtcp
+        handle_rtp = self._handle_rtp
+        rtcp_payload_types_get = RTCP_PAYLOAD_TYPES.get
 
-                payload_type = RTPPayloadTypes.get(rtp.payload_type)
+        while True:
+            try:
+                packets = recv_packets()
+            except ConnectionRefusedError:
+                # The socket is connected, so ICMP port unreachable surfaces here, just keep reading
+                self.log.debug('[{}] [VoiceData] Voice server refused the connection'.format(self.vc.channel_id))
+                continue
 
-                # Unsupported payload type received
-                if not payload_type:
-                    self.log.debug('[{}] [VoiceData] Received unsupported payload type, {}'.format(self.vc.channel_id, rtp.payload_type))
+            # Packets are views into shared receive buffers, copy anything that outlives this iteration
+            for data in packets:
+                # Data cannot be less than the bare minimum, just ignore
+                if len(data) <= 12:
+                    self.log.debug('[{}] [VoiceData] Received voice data under 13 bytes'.format(self.vc.channel_id))
                     continue
 
-                if self.vc.mode == 'aead_aes256_gcm_rtpsize':
-                    nonce = bytearray(12)  # 96-bits
-                else:
-                    nonce = bytearray(24)  # 192-bits is 24 bytes
-
-                nonce[:4] = data[-4:]
-                data = data[:-4]
-
-                if self.vc.mode not in ('aead_xchacha20_poly1305_rtpsize', 'aead_aes256_gcm_rtpsize'):
-                    self.log.debug(f'[{self.vc.channel_id}] [VoiceData] Unsupported Encryption Mode, {self.vc.mode}')
+                payload_type = rtcp_payload_types_get(data[1])
+                if payload_type:
+                    emit('RTCPData', handle_rtcp(data, payload_type))
                     continue
 
-                header_size = 12
-                header_size += (rtp.csrc_count * 4)
-                if rtp.extension:
-                    header_size += 4
-                ctxt = data[header_size:]  # plus strip whatever additional bs is before the payload
+                event = handle_rtp(data)
+                if event:
+                    emit(*event)
 
-                try:
-                    data = self._secret_box.decrypt(ciphertext=bytes(ctxt), nonce=bytes(nonce), aad=bytes(data[:header_size]))
-                except Exception as e:
-                    self.log.debug('[{}] [VoiceData] Failed to decode data from ssrc {}: {} - {}'.format(self.vc.channel_id, rtp.ssrc, e.__class__.__name__, e))
-                    continue
+    def _handle_rtcp(self, data, payload_type):
+        first, second, length, ssrc = RTCP_HEADER_UNPACK.unpack_from(data)
 
-                # RFC3550 Section 5.1 (Padding)
-                if rtp.padding:
-                    padding_amount, = struct_unpack_from('>B', data[:-1])  # BE, unsigned char
-                    data = data[-padding_amount:]
-
-                if rtp.extension:
-                    # RFC5285 Section 4.2: One-Byte Header
-                    rtp_extension_header = struct_unpack_from('>BB', data)  # BE, 2x unsigned char
-                    if rtp_extension_header == RTP_EXTENSION_ONE_BYTE:
-                        data = data[2:]
-
-                        fields_amount, = struct_unpack_from('>H', data)  # BE, unsigned short
-                        fields = []
-
-                        offset = 4
-                        for i in range(fields_amount):
-                            first_byte, = struct_unpack_from('>B', data[:offset])  # BE, unsigned char
-                            offset += 1
-
-                            rtp_extension_identifier = first_byte & 0xF
-                            rtp_extension_len = ((first_byte >> 4) & 0xF) + 1
-
-                            # Ignore data if identifier == 15, so skip if this is set as 0
-                            if rtp_extension_identifier:
-                                fields.append(data[offset:offset + rtp_extension_len])
-
-                            offset += rtp_extension_len
-
-                            # skip padding
-                            while data[offset] == 0:
-                                offset += 1
-
-                        if len(fields):
-                            fields.append(data[offset:])
-                            data = b''.join(fields)
-                        else:
-                            data = data[offset:]
-
-                # RFC3550 Section 5.3: Profile-Specific Modifications to the RTP Header
-                # clients send it sometimes, definitely on fresh connects to a server, dunno what to do here
-                # RFC6184: Marker bits are used to signify the last packet of a frame
-                if rtp.marker and payload_type.name == 'opus':
-                    self.log.debug('[{}] [VoiceData] Received RTP data with the marker set, skipping'.format(self.vc.channel_id))
-                    continue
+        rtcp = RTCPHeader(
+            first >> 6,
+            (first >> 5) & 1,
+            first & 0x1F,
+            second,
+            length,
+            ssrc,
+        )
 
-                if payload_type.name == 'opus':
-                    payload = VoiceData(
-                        client=self.vc,
-                        user_id=self.vc.audio_ssrcs.get(rtp.ssrc),
-                        payload_type=payload_type.name,
-                        rtp=rtp,
-                        nonce=nonce,
-                        data=data,
-                    )
-
-                    # Raw RTP stream data, still needs conversion to be useful
-                    self.vc.client.events.emit('VoiceData', payload)
+        if rtcp.ssrc == self.vc.ssrc_rtcp:
+            user_id = self.vc.user_id
+        else:
+            rtcp_ssrc = rtcp.ssrc
+            if rtcp_ssrc:
+                rtcp_ssrc -= 3
+            user_id = self._audio_ssrcs_get(rtcp_ssrc, None)
+
+        return RTCPData(
+            self.vc,
+            user_id,
+            payload_type.name,
+            rtcp,
+            bytes(data[8:]),
+        )
+
+    def _handle_rtp(self, data):
+        word, timestamp, ssrc = RTP_HEADER_UNPACK.unpack_from(data)
+
+        # Validate straight off the raw header, the RTPHeader is only built for packets we actually emit
+        # Check if rtp version is 2
+        version = word >> 30
+        if version != 2:
+            self.log.debug('[{}] [VoiceData] Received an invalid RTP packet version, {}'.format(self.vc.channel_id, version))
+            return
+
+        payload_type_value = (word >> 16) & 0x7F
+        payload_type = RTP_PAYLOAD_TYPES.get(payload_type_value)
+
+        # Unsupported payload type received
+        if not payload_type:
+            self.log.debug('[{}] [VoiceData] Received unsupported payload type, {}'.format(self.vc.channel_id, payload_type_value))
+            return
+
+        is_opus = payload_type_value == OPUS_PAYLOAD_TYPE
+
+        # RFC3550 Section 5.3: Profile-Specific Modifications to the RTP Header
+        # clients send it sometimes, definitely on fresh connects to a server, dunno what to do here
+        # RFC6184: Marker bits are used to signify the last packet of a frame
+        marker = (word >> 23) & 1
+        if marker and is_opus:
+            self.log.debug('[{}] [VoiceData] Received RTP data with the marker set, skipping'.format(self.vc.channel_id))
+            return
+
+        padding = (word >> 29) & 1
+        extension = (word >> 28) & 1
+        csrc_count = (word >> 24) & 0x0F
+
+        # Nothing can be decrypted until the session description has been received
+        if not self._decrypt:
+            self.log.debug('[{}] [VoiceData] Received RTP data before encryption was set up'.format(self.vc.channel_id))
+            return
+
+        # Only the first 4 bytes of the reused nonce are ever written, the bytes copy is what decrypt and listeners get
+        self._recv_nonce[:4] = data[-4:]
+        nonce = bytes(self._recv_nonce)
+
+        header_size = 12
+        header_size += (csrc_count * 4)
+        if extension:
+            header_size += 4
+        # Both stay views into the receive buffer, AEScrypt hands them to libsodium without copying
+        ctxt = data[header_size:-4]  # plus strip whatever additional bs is before the payload, and the nonce after it
+
+        # The AAD is the raw header as received, for the rtpsize modes that includes CSRCs and the extension header
+        header = data[:header_size]
+
+        try:
+            data = self._decrypt(ciphertext=ctxt, nonce=nonce, aad=header)
+        except Exception as e:
+            self.log.debug('[{}] [VoiceData] Failed to decode data from ssrc {}: {} - {}'.format(self.vc.channel_id, ssrc, e.__class__.__name__, e))
+            return
+
+        # RFC3550 Section 5.1 (Padding)
+        if padding:
+            # The last octet holds how many padding octets (itself included) to strip, 0 strips nothing
+            if not data or data[-1] > len(data):
+                self.log.debug('[{}] [VoiceData] Received invalid RTP padding from ssrc {}'.format(self.vc.channel_id, ssrc))
+                return
+
+            padding_amount = data[-1]
+            if padding_amount:
+                data = data[:-padding_amount]
+
+        if extension:
+            # RFC5285 Section 4.2: One-Byte Header
+            view = memoryview(data)  # index and slice without copying, materialized once below
+
+            # Too short to even hold the profile and length
+            if len(view) < 4:
+                self.log.debug('[{}] [VoiceData] Received a truncated RTP header extension from ssrc {}'.format(self.vc.channel_id, ssrc))
+                return
+
+            if (view[0], view[1]) == RTP_EXTENSION_ONE_BYTE:
+                view = view[2:]
+
+                fields_amount = (view[0] << 8) | view[1]  # BE, unsigned short
+                fields = []
+
+                view_len = len(view)
+                offset = 4
+                for i in range(fields_amount):
+                    if offset >= view_len:
+                        break
+
+                    rtp_extension_identifier, rtp_extension_len = RTP_EXTENSION_ONE_BYTE_DECODE[view[offset]]
+                    offset += 1
+
+                    # Ignore data if identifier == 15, so skip if this is set as 0
+                    if rtp_extension_identifier:
+                        fields.append(view[offset:offset + rtp_extension_len])
+
+                    offset += rtp_extension_len
+
+                    # skip padding, only when there is any; the scan runs in C over the view without copying the rest
+                    if offset < view_len and view[offset] == 0:
+                        padding_end = RTP_EXTENSION_PADDING_END(view, offset)
+                        offset = padding_end.start() if padding_end else view_len
+
+                # The extension claimed more data than the packet holds
+                if offset > view_len:
+                    self.log.debug('[{}] [VoiceData] Received a malformed RTP header extension from ssrc {}'.format(self.vc.channel_id, ssrc))
+                    return
+
+                if len(fields):
+                    fields.append(view[offset:])
+                    data = b''.join(fields)
                 else:
-                    payload = VideoData(
-                        client=self.vc,
-                        user_id=self.vc.video_ssrcs.get(rtp.ssrc),
-                        payload_type=payload_type.name,
-                        rtp=rtp,
-                        nonce=nonce,
-                        data=data,
-                    )
-
-                    # Raw RTP stream data, still needs conversion to be useful
-                    self.vc.client.events.emit('VideoData', payload)
-
-    def send(self, data):
-        self.conn.sendto(data, (self.ip, self.port))
+                    data = bytes(view[offset:])
+
+        rtp = RTPHeader(
+            version,
+            padding,
+            extension,
+            csrc_count,
+            marker,
+            payload_type_value,
+            word & 0xFFFF,
+            timestamp,
+            ssrc,
+        )
+
+        if is_opus:
+            return self._handle_opus(rtp, payload_type, nonce, data)
+        return self._handle_video(rtp, payload_type, nonce, data)
+
+    def _handle_opus(self, rtp, payload_type, nonce, data):
+        # Raw RTP stream data, still needs conversion to be useful
+        return 'VoiceData', VoiceData(
+            self.vc,
+            self._audio_ssrcs_get(rtp.ssrc),
+            payload_type.name,
+            rtp,
+            nonce,
+            data,
+        )
+
+    def _handle_video(self, rtp, payload_type, nonce, data):
+        # Raw RTP stream data, still needs conversion to be useful
+        return 'VideoData', VideoData(
+            self.vc,
+            self._video_ssrcs_get(rtp.ssrc),
+            payload_type.name,
+            rtp,
+            nonce,
+            data,
+        )
+
+    def send(self, *buffers):
+        if self._sender:
+            self._sender.send(self.conn, b''.join(buffers))
+        elif HAS_SENDMSG:
+            self.conn.sendmsg(buffers)
+        else:
+            self.conn.send(b''.join(buffers))
 
     def disconnect(self):
         if self._run_task:
             self._run_task.kill()
         return
 
-    def connect(self, host, port, timeout=10, addrinfo=None):
+    def connect(self, host, port, timeout=10, addrinfo=None, snd_buf=1 << 20, rcv_buf=1 << 20, dscp=46):
         self.ip = socket_gethostbyname(host)
         self.port = port
+        self._dest = (self.ip, self.port)
+
+        # A new client is created for every READY, so the SSRC is fixed from here on
+        self.set_ssrc(self.vc.ssrc_audio)
 
         self.conn = socket(SOCKET_AF_INET, SOCKET_SOCK_DGRAM)
 
+        # Larger kernel buffers so bursts of frames don't block the hub, DSCP 46 (EF) so hops prioritize voice
+        try:
+            if snd_buf:
+                self.conn.setsockopt(SOCKET_SOL_SOCKET, SOCKET_SO_SNDBUF, snd_buf)
+            if rcv_buf:
+                self.conn.setsockopt(SOCKET_SOL_SOCKET, SOCKET_SO_RCVBUF, rcv_buf)
+            if dscp:
+                self.conn.setsockopt(SOCKET_IPPROTO_IP, SOCKET_IP_TOS, dscp << 2)
+        except OSError as e:
+            self.log.debug('[{}] Failed to tune UDP socket options: {}'.format(self.vc.channel_id, e))
+
+        # Discord only ever talks to us from this one endpoint, connecting skips the per-send route lookup
+        self.conn.connect(self._dest)
+
+        if HAS_RECVMMSG:
+            self._rx_batch = RecvMMsg(self.conn, vlen=self.RECV_BATCH_SIZE, size=len(self._rx_buf))
+
         if addrinfo:
             ip, port = addrinfo
         else:
@@ -357,16 +528,24 @@ class UDPVoiceClient(LoggingClass):
             struct_pack_into('>H', packet, 0, 1)  # BE, unsigned short
             struct_pack_into('>H', packet, 2, 70)  # BE, unsigned short
             struct_pack_into('>I', packet, 4, self.vc.ssrc)  # BE, unsigned int
-            self.send(packet)
 
-            # Wait for a response
+            # Sent directly, the recv() below would block the batched sender's greenlet from ever flushing it
+            self.conn.send(packet)
+
+            # Wait for a response, using the socket's own timeout so this holds whether or not socket is monkey-patched
+            self.conn.settimeout(timeout)
             try:
-                data, addr = gevent_spawn(lambda: self.conn.recvfrom(74)).get(timeout=timeout)
-            except GeventTimeout:
+                data = self.conn.recv(74)
+            except (SocketTimeout, ConnectionRefusedError):
+                # The socket is connected, so ICMP port unreachable is raised here rather than timing out
+                self._rx_batch = None
+                self.conn.close()
                 return None, None
 
+            self.conn.settimeout(None)
+
             # Read IP and port
-            ip = str(data[8:].split(b'\x00', 1)[0], "utf=8")
+            ip = data[8:72].partition(b'\x00')[0].decode('ascii')  # null-terminated, within the 64 byte address field
             port = struct_unpack('<H', data[-2:])[0]  # little endian, unsigned short
 
         # Spawn read thread so we don't max buffers